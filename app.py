@@ -6,11 +6,27 @@ Versione ottimizzata per Railway deployment
 """
 import os
 import sys
+import hmac
 import logging
 from datetime import datetime
+from functools import lru_cache
+import orjson
+import pybreaker
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from flask_caching import Cache
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.sql.expression import FunctionElement
 
 # Configurazione logging
 logging.basicConfig(
@@ -20,8 +36,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Serializzazione JSON con orjson (implementazione C, molto più veloce della stdlib)
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider Flask basato su orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # Inizializzazione Flask
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+# Railway inoltra le richieste tramite proxy: l'IP reale è in X-Forwarded-For
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
 CORS(app)
 
 # Configurazione Secret Key
@@ -41,22 +71,101 @@ else:
     logger.info("Uso SQLite locale")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Budget connessioni: WEB_CONCURRENCY x (pool_size + max_overflow) <= DB_CONNECTION_BUDGET.
+# Il default 45 lascia margine su max_connections=100 di PostgreSQL anche durante un
+# redeploy Railway (vecchia e nuova istanza attive insieme). Con i worker gevent le
+# greenlet in eccesso attendono al massimo pool_timeout e poi falliscono subito.
+DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', 45))
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 3))
+connections_per_worker = max(DB_CONNECTION_BUDGET // WEB_CONCURRENCY, 2)
+default_pool_size = max(connections_per_worker // 3, 1)
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True,
-    'pool_recycle': 300,
-    'pool_timeout': 20,
-    'max_overflow': 0,
-    'pool_size': 5
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 3)),
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', default_pool_size)),
+    'max_overflow': int(os.environ.get(
+        'DB_POOL_MAX_OVERFLOW', connections_per_worker - default_pool_size
+    )),
+    'pool_use_lifo': True
 }
 
+# Rate limiting (memoria locale del worker, o backend condiviso via RATELIMIT_STORAGE_URI)
+limiter = Limiter(
+    get_remote_address,
+    app=app,
+    storage_uri=os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+)
+
+# Hash argon2id della password admin (ADMIN_PASSWORD_HASH)
+password_hasher = PasswordHasher()
+DEFAULT_ADMIN_PASSWORD = 'admin123'
+DEBUG_MODE = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+
+if not os.environ.get('ADMIN_PASSWORD_HASH'):
+    if os.environ.get('ADMIN_PASSWORD', DEFAULT_ADMIN_PASSWORD) == DEFAULT_ADMIN_PASSWORD and not DEBUG_MODE:
+        logger.warning("Nessuna password admin configurata: login admin disabilitato (impostare ADMIN_PASSWORD_HASH)")
+    else:
+        logger.warning("ADMIN_PASSWORD_HASH non impostato: uso ADMIN_PASSWORD in chiaro")
+
 # Inizializzazione Database
 db = SQLAlchemy(app)
 
+# Cache in-process per le risposte API lette di frequente
+cache = Cache(app, config={
+    'CACHE_TYPE': 'SimpleCache',
+    'CACHE_DEFAULT_TIMEOUT': 60
+})
+
+# Circuit breaker sul database: dopo 10 errori consecutivi le richieste
+# falliscono subito con 503 per 30s invece di attendere il pool
+class DBBreakerListener(pybreaker.CircuitBreakerListener):
+    """Log dei cambi di stato del circuit breaker con lo stato del pool"""
+    
+    def state_change(self, cb, old_state, new_state):
+        logger.warning(
+            f"Circuit breaker DB: {old_state.name} -> {new_state.name} ({db.engine.pool.status()})"
+        )
+
+# Contano solo gli errori di database irraggiungibile o pool saturo: errori dovuti
+# all'input del client (IntegrityError, DataError, StatementError, ...) non aprono il circuito
+DB_UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError)
+
+db_breaker = pybreaker.CircuitBreaker(
+    fail_max=10,
+    reset_timeout=30,
+    exclude=[lambda e: not isinstance(e, DB_UNAVAILABLE_ERRORS)],
+    listeners=[DBBreakerListener()]
+)
+
 # ========== MODELLI DATABASE ==========
 
+class utcnow(FunctionElement):
+    """Timestamp corrente in UTC calcolato dal database (colonne DateTime naive)"""
+    type = db.DateTime()
+    inherit_cache = True
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    # SQLite: CURRENT_TIMESTAMP è già UTC
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    # now() segue il TimeZone della sessione: convertito esplicitamente in UTC
+    return "timezone('utc', now())"
+
 class User(db.Model):
     """Modello utente - sia clienti che professionisti"""
     __tablename__ = 'users'
+    __table_args__ = (
+        # Indici per i filtri/ordinamento di /api/professionals; CONCURRENTLY su PostgreSQL
+        # per non bloccare le scritture se la tabella è già popolata
+        db.Index('ix_users_prof_active_rating', 'user_type', 'is_active', db.text('rating DESC'),
+                 postgresql_concurrently=True),
+        db.Index('ix_users_prof_city', 'user_type', 'city', postgresql_concurrently=True),
+        db.Index('ix_users_prof_profession', 'user_type', 'profession', postgresql_concurrently=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -78,7 +187,7 @@ class User(db.Model):
     # Stato account
     is_verified = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
 
 class Booking(db.Model):
     """Modello prenotazioni"""
@@ -92,28 +201,56 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default='pending')
     notes = db.Column(db.Text)
     total_cost = db.Column(db.Float)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), nullable=False)
+    
+    # lazy='raise': il caricamento va richiesto esplicitamente con selectinload,
+    # così eventuali query N+1 falliscono subito invece di passare inosservate
+    client = db.relationship('User', foreign_keys=[client_id], lazy='raise')
+    professional = db.relationship('User', foreign_keys=[professional_id], lazy='raise')
 
-# ========== INIZIALIZZAZIONE DATABASE ==========
+# Colonne esposte dalla lista professionisti (select Core, senza idratazione ORM)
+PROF_COLS = (
+    User.id, User.name, User.profession, User.city, User.region,
+    User.rating, User.total_reviews, User.hourly_rate, User.services_offered,
+    User.bio, User.is_verified, User.experience_years
+)
 
-db_initialized = False
+# ========== INIZIALIZZAZIONE DATABASE ==========
 
 def init_database():
-    """Inizializzazione lazy del database con dati di esempio"""
-    global db_initialized
-    if db_initialized:
-        return True
-    
+    """Inizializzazione del database con dati di esempio"""
     try:
         logger.info("Inizializzazione database...")
         with app.app_context():
-            db.create_all()
+            # AUTOCOMMIT: CREATE INDEX CONCURRENTLY non può girare in una transazione
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                db.metadata.create_all(conn)
+                
+                # create_all non aggiunge indici a tabelle già esistenti
+                for index in User.__table__.indexes:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
             
-            # Aggiungi dati di esempio solo se il DB è vuoto
+            # Tabelle create prima del default lato server su created_at: ALTER (lock
+            # ACCESS EXCLUSIVE) solo dove il default registrato è diverso
+            if db.engine.dialect.name == 'postgresql':
+                defaults = db.session.execute(db.text(
+                    "SELECT table_name, column_default FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND column_name = 'created_at' "
+                    "AND table_name IN ('users', 'bookings')"
+                )).all()
+                for table, column_default in defaults:
+                    if column_default != "timezone('utc'::text, now())":
+                        db.session.execute(db.text(
+                            f"ALTER TABLE {table} ALTER COLUMN created_at SET DEFAULT timezone('utc', now())"
+                        ))
+                db.session.commit()
+            
+            # Aggiungi dati di esempio solo se il DB è vuoto (ON CONFLICT: idempotente
+            # anche se due inizializzazioni si sovrappongono)
             if User.query.count() == 0:
                 logger.info("Creazione professionisti di esempio...")
                 professionals = [
-                    User(
+                    dict(
                         name="Dr. Marco Rossi",
                         email="marco.rossi@petcare.it",
                         phone="+39 333 1234567",
@@ -129,7 +266,7 @@ def init_database():
                         bio="Veterinario specializzato in chirurgia con 8 anni di esperienza",
                         is_verified=True
                     ),
-                    User(
+                    dict(
                         name="Laura Bianchi",
                         email="laura.bianchi@petcare.it",
                         phone="+39 347 9876543",
@@ -145,7 +282,7 @@ def init_database():
                         bio="Toelettatore certificato specializzato in razze di piccola taglia",
                         is_verified=True
                     ),
-                    User(
+                    dict(
                         name="Giuseppe Verde",
                         email="giuseppe.verde@petcare.it",
                         phone="+39 320 5551234",
@@ -161,7 +298,7 @@ def init_database():
                         bio="Dog sitter affidabile con passione per gli animali",
                         is_verified=True
                     ),
-                    User(
+                    dict(
                         name="Sofia Russo",
                         email="sofia.russo@petcare.it",
                         phone="+39 348 7778888",
@@ -179,13 +316,15 @@ def init_database():
                     )
                 ]
                 
-                for prof in professionals:
-                    db.session.add(prof)
-                
+                # Unico INSERT multi-riga, senza unit-of-work ORM
+                dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+                db.session.execute(
+                    dialect.insert(User).on_conflict_do_nothing(index_elements=['email']),
+                    professionals
+                )
                 db.session.commit()
                 logger.info(f"Creati {len(professionals)} professionisti di esempio")
             
-            db_initialized = True
             logger.info("Database inizializzato con successo")
             return True
             
@@ -194,66 +333,181 @@ def init_database():
         db.session.rollback()
         return False
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Inizializza il database una volta per deploy (preDeployCommand Railway)"""
+    if not init_database():
+        raise SystemExit(1)
+
 # ========== ROUTES PUBBLICHE ==========
 
 @app.route('/')
 def home():
     """Homepage"""
-    init_database()
     return render_template('index.html')
 
-@app.route('/health')
-def health():
-    """Health check per Railway"""
+@cache.memoize(5)
+def _db_status():
+    """Ping diretto sul driver, memoizzato per 5s contro i probe ravvicinati"""
     try:
-        db.session.execute(db.text('SELECT 1'))
-        db_status = 'connected'
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('SELECT 1')
+        return 'connected'
     except Exception as e:
         logger.error(f"Health check DB error: {e}")
-        db_status = 'disconnected'
-    
+        return 'disconnected'
+
+@app.route('/health')
+def health():
+    """Health check per Railway"""
     return jsonify({
         'status': 'healthy',
-        'database': db_status,
+        'database': _db_status(),
         'version': '3.0.0',
         'timestamp': datetime.utcnow().isoformat()
     })
 
+# ========== ACCESSO DATABASE ==========
+
+@db_breaker
+def fetch_one(statement):
+    """Prima riga di una select, su una connessione restituita subito al pool"""
+    with db.engine.connect() as conn:
+        return conn.execute(statement).first()
+
+@db_breaker
+def insert_returning_id(statement):
+    """Esegue un INSERT ... RETURNING id e fa commit"""
+    try:
+        new_id = db.session.execute(statement).scalar_one()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return new_id
+
+def db_unavailable():
+    """Risposta 503 quando il circuit breaker del database è aperto"""
+    response = jsonify({'error': 'Servizio temporaneamente non disponibile'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(db_breaker.reset_timeout))
+    return response
+
 # ========== API ENDPOINTS ==========
 
+def _conditional_response(response, max_age=60):
+    """Aggiunge ETag e Cache-Control, rispondendo 304 se il client ha già i dati"""
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@lru_cache(maxsize=2048)
+def _render_professional(row):
+    """JSON di un professionista, memoizzato sulla riga stessa: se un campo cambia cambia anche la chiave"""
+    (id_, name, prof, prof_city, region, rating, total_reviews, hourly_rate,
+     services_offered, bio, is_verified, experience_years) = row
+    return orjson.dumps({
+        'id': id_,
+        'name': name,
+        'profession': prof or 'Professionista',
+        'city': prof_city or 'N/A',
+        'region': region or 'N/A',
+        'rating': rating,
+        'total_reviews': total_reviews,
+        'hourly_rate': hourly_rate,
+        'services_offered': services_offered or 'Servizi vari',
+        'bio': bio or 'Professionista qualificato',
+        'is_verified': is_verified,
+        'experience_years': experience_years
+    }, option=orjson.OPT_SORT_KEYS)
+
+def _professionals_query(profession, city, ids=None):
+    """Select Core della lista professionisti attivi, ordinata per rating"""
+    query = db.select(*PROF_COLS).where(
+        User.user_type == 'professional',
+        User.is_active.is_(True)
+    )
+    
+    if profession:
+        query = query.where(User.profession == profession)
+    if city:
+        query = query.where(User.city == city)
+    if ids:
+        query = query.where(User.id.in_(ids))
+    
+    return query.order_by(User.rating.desc())
+
+def _professionals_filter_key(profession, city, ids=None):
+    """Parte della chiave cache che identifica i filtri della lista"""
+    # repr della tupla: None, "None" e valori contenenti ':' restano distinti
+    return repr((profession or None, city or None, tuple(ids or ())))
+
+# Versione delle liste in cache: variabile di modulo, non nella SimpleCache dove
+# potrebbe essere rimossa quando la cache si riempie (la cache è comunque per-processo)
+_professionals_version = 0
+
+def _professionals_cache_key(profession, city, ids=None):
+    """Chiave cache della lista, versionata per l'invalidazione"""
+    return f'professionals:{_professionals_version}:{_professionals_filter_key(profession, city, ids)}'
+
+# Ultima lista completa (senza filtri) letta dal database, servita quando il circuit
+# breaker è aperto. Solo quella: le combinazioni di filtri arrivano dal client e non
+# vanno conservate senza limiti
+_stale_professionals = None
+
+def _remember_stale_professionals(body):
+    """Aggiorna la copia di riserva della lista completa"""
+    global _stale_professionals
+    _stale_professionals = body
+
+@db_breaker
+def _render_professionals(query):
+    """Serializza la lista, su una connessione chiusa prima della risposta"""
+    with db.engine.connect() as conn:
+        rows = conn.execute(query).all()
+    return b'[' + b','.join(_render_professional(tuple(row)) for row in rows) + b']'
+
+def invalidate_professionals_cache():
+    """Invalida tutte le liste professionisti in cache"""
+    global _professionals_version
+    _professionals_version += 1
+
 @app.route('/api/professionals')
 def get_professionals():
     """Ottieni lista professionisti"""
     try:
-        init_database()
-        
         # Filtri opzionali
         profession = request.args.get('profession')
         city = request.args.get('city')
         
-        query = User.query.filter_by(user_type='professional', is_active=True)
+        # ?ids=1,2,3 (max 100): più profili in una sola query, da preferire a chiamate
+        # ripetute a /api/professionals/<id>. Ordine per rating, il client riordina per 'id'
+        ids = None
+        if request.args.get('ids'):
+            try:
+                ids = sorted({int(x) for x in request.args['ids'].split(',')})[:100]
+            except ValueError:
+                return jsonify({'error': 'Parametro ids non valido'}), 400
         
-        if profession:
-            query = query.filter_by(profession=profession)
-        if city:
-            query = query.filter_by(city=city)
+        cache_key = _professionals_cache_key(profession, city, ids)
+        body = cache.get(cache_key)
+        if body is not None:
+            return _conditional_response(app.response_class(body, mimetype='application/json'))
         
-        professionals = query.order_by(User.rating.desc()).all()
+        # Cache miss: connessione già restituita al pool prima di inviare la
+        # risposta (anche per HEAD o client lenti)
+        try:
+            body = _render_professionals(_professionals_query(profession, city, ids))
+        except pybreaker.CircuitBreakerError:
+            body = None if (profession or city or ids) else _stale_professionals
+            if body is None:
+                return db_unavailable()
+            return _conditional_response(app.response_class(body, mimetype='application/json'))
         
-        return jsonify([{
-            'id': p.id,
-            'name': p.name,
-            'profession': p.profession or 'Professionista',
-            'city': p.city or 'N/A',
-            'region': p.region or 'N/A',
-            'rating': p.rating,
-            'total_reviews': p.total_reviews,
-            'hourly_rate': p.hourly_rate,
-            'services_offered': p.services_offered or 'Servizi vari',
-            'bio': p.bio or 'Professionista qualificato',
-            'is_verified': p.is_verified,
-            'experience_years': p.experience_years
-        } for p in professionals])
+        cache.set(cache_key, body)
+        if not (profession or city or ids):
+            _remember_stale_professionals(body)
+        return _conditional_response(app.response_class(body, mimetype='application/json'))
         
     except Exception as e:
         logger.error(f"Errore get_professionals: {e}")
@@ -261,18 +515,19 @@ def get_professionals():
 
 @app.route('/api/professionals/<int:prof_id>')
 def get_professional(prof_id):
-    """Ottieni dettagli singolo professionista"""
+    """Ottieni dettagli singolo professionista (per più profili usare /api/professionals?ids=...)"""
     try:
-        professional = User.query.filter_by(
-            id=prof_id,
-            user_type='professional',
-            is_active=True
-        ).first()
+        query = db.select(*PROF_COLS, User.phone).where(
+            User.id == prof_id,
+            User.user_type == 'professional',
+            User.is_active.is_(True)
+        )
+        professional = fetch_one(query)
         
         if not professional:
             return jsonify({'error': 'Professionista non trovato'}), 404
         
-        return jsonify({
+        return _conditional_response(jsonify({
             'id': professional.id,
             'name': professional.name,
             'profession': professional.profession,
@@ -286,29 +541,33 @@ def get_professional(prof_id):
             'is_verified': professional.is_verified,
             'experience_years': professional.experience_years,
             'phone': professional.phone
-        })
+        }))
         
+    except pybreaker.CircuitBreakerError:
+        return db_unavailable()
     except Exception as e:
         logger.error(f"Errore get_professional: {e}")
         return jsonify({'error': 'Errore nel recupero del professionista'}), 500
 
+def _is_duplicate_email(error):
+    """True se l'IntegrityError è la violazione del vincolo UNIQUE su users.email"""
+    orig = error.orig
+    if getattr(orig, 'pgcode', None) == '23505':  # unique_violation (psycopg2)
+        return orig.diag.constraint_name == 'users_email_key'
+    return 'UNIQUE constraint failed: users.email' in str(orig)
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """Registrazione nuovo utente"""
     try:
-        init_database()
         data = request.get_json()
         
         # Validazione dati
         if not data or not data.get('name') or not data.get('email'):
             return jsonify({'error': 'Nome e email sono obbligatori'}), 400
         
-        # Controlla se email già esiste
-        if User.query.filter_by(email=data['email']).first():
-            return jsonify({'error': 'Email già registrata'}), 400
-        
-        # Crea nuovo utente
-        new_user = User(
+        # Crea nuovo utente: un solo INSERT ... RETURNING id, senza oggetti ORM
+        stmt = db.insert(User).values(
             name=data['name'],
             email=data['email'],
             phone=data.get('phone', ''),
@@ -316,17 +575,26 @@ def register():
             profession=data.get('profession', ''),
             city=data.get('city', ''),
             region=data.get('region', '')
-        )
+        ).returning(User.id)
         
-        db.session.add(new_user)
-        db.session.commit()
+        # L'unicità dell'email è garantita dal vincolo UNIQUE, senza SELECT preventiva
+        try:
+            user_id = insert_returning_id(stmt)
+        except IntegrityError as e:
+            if _is_duplicate_email(e):
+                return jsonify({'error': 'Email già registrata'}), 400
+            logger.warning(f"Registrazione rifiutata dal database: {e.orig}")
+            return jsonify({'error': 'Dati di registrazione non validi'}), 400
+        invalidate_professionals_cache()
         
-        logger.info(f"Nuovo utente registrato: {new_user.email}")
+        logger.info(f"Nuovo utente registrato: {data['email']}")
         return jsonify({
             'message': 'Registrazione completata con successo',
-            'user_id': new_user.id
+            'user_id': user_id
         }), 201
         
+    except pybreaker.CircuitBreakerError:
+        return db_unavailable()
     except Exception as e:
         logger.error(f"Errore registrazione: {e}")
         db.session.rollback()
@@ -336,7 +604,6 @@ def register():
 def create_booking():
     """Crea nuova prenotazione"""
     try:
-        init_database()
         data = request.get_json()
         
         # Validazione
@@ -344,25 +611,26 @@ def create_booking():
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Campi obbligatori mancanti'}), 400
         
-        # Crea prenotazione
-        new_booking = Booking(
+        # Crea prenotazione: un solo INSERT ... RETURNING id, senza oggetti ORM
+        stmt = db.insert(Booking).values(
             client_id=data['client_id'],
             professional_id=data['professional_id'],
             service_type=data['service_type'],
             booking_date=datetime.fromisoformat(data['booking_date']),
             notes=data.get('notes', ''),
             total_cost=data.get('total_cost', 0.0)
-        )
+        ).returning(Booking.id)
         
-        db.session.add(new_booking)
-        db.session.commit()
+        booking_id = insert_returning_id(stmt)
         
-        logger.info(f"Nuova prenotazione creata: {new_booking.id}")
+        logger.info(f"Nuova prenotazione creata: {booking_id}")
         return jsonify({
             'message': 'Prenotazione creata con successo',
-            'booking_id': new_booking.id
+            'booking_id': booking_id
         }), 201
         
+    except pybreaker.CircuitBreakerError:
+        return db_unavailable()
     except Exception as e:
         logger.error(f"Errore creazione prenotazione: {e}")
         db.session.rollback()
@@ -370,17 +638,39 @@ def create_booking():
 
 # ========== ADMIN ROUTES ==========
 
+def check_admin_credentials(username, password):
+    """Verifica credenziali admin con confronti a tempo costante"""
+    admin_user = os.environ.get('ADMIN_USERNAME', 'admin')
+    user_ok = hmac.compare_digest(username.encode(), admin_user.encode())
+    
+    password_hash = os.environ.get('ADMIN_PASSWORD_HASH')
+    if password_hash:
+        try:
+            password_ok = password_hasher.verify(password_hash, password)
+        except InvalidHashError:
+            logger.error("ADMIN_PASSWORD_HASH non è un hash argon2 valido")
+            password_ok = False
+        except VerificationError:
+            password_ok = False
+    else:
+        # Compatibilità: password in chiaro in ADMIN_PASSWORD; quella di default
+        # è accettata solo in debug
+        admin_pass = os.environ.get('ADMIN_PASSWORD', DEFAULT_ADMIN_PASSWORD)
+        if admin_pass == DEFAULT_ADMIN_PASSWORD and not DEBUG_MODE:
+            return False
+        password_ok = hmac.compare_digest(password.encode(), admin_pass.encode())
+    
+    return user_ok and password_ok
+
 @app.route('/admin/login', methods=['GET', 'POST'])
+@limiter.limit('5 per minute', methods=['POST'])
 def admin_login():
     """Login amministratore"""
     if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
+        username = request.form.get('username', '')
+        password = request.form.get('password', '')
         
-        admin_user = os.environ.get('ADMIN_USERNAME', 'admin')
-        admin_pass = os.environ.get('ADMIN_PASSWORD', 'admin123')
-        
-        if username == admin_user and password == admin_pass:
+        if check_admin_credentials(username, password):
             session['admin_logged_in'] = True
             logger.info(f"Admin login riuscito: {username}")
             return redirect(url_for('admin_dashboard'))
@@ -396,7 +686,6 @@ def admin_dashboard():
     if not session.get('admin_logged_in'):
         return redirect(url_for('admin_login'))
     
-    init_database()
     return render_template('admin_dashboard.html')
 
 @app.route('/admin/logout')
@@ -413,22 +702,27 @@ def admin_stats():
         return jsonify({'error': 'Non autorizzato'}), 401
     
     try:
-        init_database()
+        # Tutti i conteggi in un solo roundtrip (SUM/CASE è portabile su SQLite e PostgreSQL)
+        def count_if(condition):
+            return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
         
-        stats = {
-            'total_users': User.query.count(),
-            'total_professionals': User.query.filter_by(user_type='professional').count(),
-            'total_clients': User.query.filter_by(user_type='client').count(),
-            'verified_professionals': User.query.filter_by(
-                user_type='professional',
-                is_verified=True
-            ).count(),
-            'total_bookings': Booking.query.count(),
-            'pending_bookings': Booking.query.filter_by(status='pending').count()
-        }
+        is_professional = User.user_type == 'professional'
+        query = db.select(
+            db.func.count(User.id).label('total_users'),
+            count_if(is_professional).label('total_professionals'),
+            count_if(User.user_type == 'client').label('total_clients'),
+            count_if(db.and_(is_professional, User.is_verified.is_(True))).label('verified_professionals'),
+            db.select(db.func.count(Booking.id)).scalar_subquery().label('total_bookings'),
+            db.select(db.func.count(Booking.id)).where(
+                Booking.status == 'pending'
+            ).scalar_subquery().label('pending_bookings')
+        )
+        stats = dict(fetch_one(query)._mapping)
         
         return jsonify(stats)
         
+    except pybreaker.CircuitBreakerError:
+        return db_unavailable()
     except Exception as e:
         logger.error(f"Errore statistiche admin: {e}")
         return jsonify({'error': 'Errore nel recupero delle statistiche'}), 500
@@ -452,9 +746,10 @@ def internal_error(e):
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     
     logger.info(f"Avvio Petcare sulla porta {port}")
-    logger.info(f"Debug mode: {debug_mode}")
+    logger.info(f"Debug mode: {DEBUG_MODE}")
     
-    app.run(host='0.0.0.0', port=port, debug=debug_mode)
+    # In sviluppo locale non c'è pre-deploy: inizializza qui
+    init_database()
+    app.run(host='0.0.0.0', port=port, debug=DEBUG_MODE)
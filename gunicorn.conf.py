@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+Configurazione gunicorn per Railway
+Worker gevent: le chiamate I/O al database si sovrappongono invece di bloccare il worker
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+# Il pool SQLAlchemy di ogni worker è ricavato da WEB_CONCURRENCY e DB_CONNECTION_BUDGET (app.py)
+workers = int(os.environ.get('WEB_CONCURRENCY', 3))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+timeout = 30
+errorlog = '-'
+
+def post_fork(server, worker):
+    """Rende cooperativo psycopg2 (estensione C) con gevent"""
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()